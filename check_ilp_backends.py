@@ -0,0 +1,103 @@
+"""
+Brute-force check of the ILP recommendation backends
+=====================================================
+
+Solves random small catalogs (ties, same-slot dominance and diversity trade-offs are
+common by construction) with every backend of ilp_recommendation_example.get_top2_plans
+and compares plan 1 and plan 2 with an itertools enumeration of all class subsets. This
+is what guards presolve_dominations and tighten_max_classes: a wrong fixing or count
+limit shows up as a plan 1 / plan 2 objective that is lower than the brute-force one.
+
+Run: python check_ilp_backends.py [cases]   (exits 1 on the first mismatch)
+"""
+
+import itertools
+import random
+import sys
+
+import ilp_recommendation_example as ilp
+
+BACKENDS = ("enumerate", "highs", "pulp")
+CATEGORY_NAMES = ("cardio", "mind_body", "strength", "flex")
+
+
+def random_catalog(rng):
+    """Catalog of 0-7 classes with small value ranges, so equal scores, prices and durations are frequent."""
+    return {
+        f"C{i}": {
+            "price": rng.randint(5, 25),
+            "duration": rng.choice((30, 45, 60)),
+            "time_slot": rng.choice(ilp.TIME_SLOTS),
+            "category": rng.choice(CATEGORY_NAMES[:rng.randint(1, len(CATEGORY_NAMES))]),
+            "preference_score": rng.randint(1, 5),
+        }
+        for i in range(rng.randint(0, 7))
+    }
+
+
+def plan_value(classes, plan, scores, max_budget, max_classes, max_duration, diversity_bonus):
+    """Objective of a set of class names, or None if it breaks a constraint."""
+    slots = [classes[c]["time_slot"] for c in plan]
+    if (
+        len(plan) > max_classes
+        or len(set(slots)) < len(slots)
+        or sum(classes[c]["price"] for c in plan) > max_budget
+        or sum(classes[c]["duration"] for c in plan) > max_duration
+    ):
+        return None
+    return sum(scores[c] for c in plan) + diversity_bonus * len({classes[c]["category"] for c in plan})
+
+
+def brute_force_top2(classes, scores, *limits):
+    """The two best objectives over every feasible class subset (fewer if there are fewer plans)."""
+    values = []
+    for r in range(len(classes) + 1):
+        for plan in itertools.combinations(classes, r):
+            value = plan_value(classes, plan, scores, *limits)
+            if value is not None:
+                values.append(value)
+    return sorted(values, reverse=True)[:2]
+
+
+def check_case(rng):
+    """Solve one random catalog, user and set of limits with every backend; returns a list of errors."""
+    classes = random_catalog(rng)
+    user_preferences = {c: rng.randint(1, 5) for c in classes if rng.random() < 0.7} or None
+    limits = (rng.choice((0, 20, 35, 50, 80)), rng.randint(0, 4), rng.choice((0, 60, 105, 150, 240)),
+              rng.choice((0, 1.0, 2.0, 3.5)))
+    scores = {c: (user_preferences or {}).get(c, info["preference_score"]) for c, info in classes.items()}
+    expected = brute_force_top2(classes, scores, *limits)
+
+    errors = []
+    for backend in BACKENDS:
+        plan1, obj1, plan2, obj2 = ilp.get_top2_plans(classes, user_preferences, *limits, backend=backend)
+        got = [(plan, obj) for plan, obj in ((plan1, obj1), (plan2, obj2)) if plan is not None]
+        if len(got) != len(expected):
+            errors.append(f"{backend}: {len(got)} plans, expected {len(expected)}")
+            continue
+        for (plan, obj), want in zip(got, expected):
+            if obj is None and not classes:  # PuLP reports no value for an objective without terms
+                obj = 0
+            value = plan_value(classes, plan.classes, scores, *limits)
+            if value is None or abs(value - want) > 1e-6 or abs(obj - want) > 1e-6:
+                errors.append(f"{backend}: plan {plan.classes} has objective {obj} (recomputed {value}), expected {want}")
+        if len(got) == 2 and plan1.classes == plan2.classes:
+            errors.append(f"{backend}: plan 2 repeats plan 1 {plan1.classes}")
+    if errors:
+        errors.insert(0, f"catalog={classes} user={user_preferences} limits={limits}")
+    return errors
+
+
+def main(cases=300, seed=0):
+    rng = random.Random(seed)
+    for case in range(cases):
+        errors = check_case(rng)
+        if errors:
+            sys.stdout.write(f"MISMATCH in case {case}:\n  " + "\n  ".join(errors) + "\n")
+            return 1
+    sys.stdout.write(f"{cases} random catalogs: {', '.join(BACKENDS)} match brute force\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:2])))
@@ -7,10 +7,26 @@ Features:
 - Diversity: bonus for selecting classes from different categories
 - Top-2 plans: best and second-best recommendation sets
 
-Install: pip install pulp
+Install: pip install pulp numpy scipy  (optional: numba, for fast batched recommendations)
 """
 
-from pulp import LpMaximize, LpProblem, LpVariable, lpSum, LpStatus
+import sys
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import NamedTuple
+
+import numpy as np
+from pulp import PULP_CBC_CMD, LpAffineExpression, LpMaximize, LpProblem, LpVariable
+from scipy.optimize import Bounds, LinearConstraint, milp
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional: the batch kernel then runs as plain Python
+    prange = range
+
+    def njit(*args, **kwargs):
+        return lambda func: func
 
 # ============================================
 # PROBLEM DATA
@@ -25,12 +41,73 @@ CLASSES = {
     "Boxing":   {"price": 25, "duration": 60, "time_slot": "evening",   "category": "strength",  "preference_score": 10},
     "Zumba":    {"price": 12, "duration": 45, "time_slot": "evening",   "category": "cardio",    "preference_score": 5},
 }
+# Read-only: the catalog arrays, default scores and generated solver below are built from it at
+# import, so edit the table above (or pass another catalog dict to the build/solve functions).
+CLASSES = MappingProxyType({c: MappingProxyType(info) for c, info in CLASSES.items()})
 
 # Default member constraints
 MAX_BUDGET = 50
 MAX_CLASSES = 3
 MAX_DURATION = 150
-TIME_SLOTS = ["morning", "afternoon", "evening"]
+TIME_SLOTS = ("morning", "afternoon", "evening")
+
+# ============================================
+# CATALOG ARRAYS: CLASSES as a structure of arrays
+# ============================================
+# CLASSES is convenient to read but costs several dict lookups per term when building the
+# model. The same data is laid out once here as parallel arrays indexed by the position of
+# the class in names, plus the member indices of every time slot and category.
+
+
+class CatalogArrays(NamedTuple):
+    """A class catalog as parallel arrays in catalog order (see build_class_arrays)."""
+    names: list[str]
+    prices: np.ndarray
+    durations: np.ndarray
+    category_idx: np.ndarray
+    slot_idx: np.ndarray
+    default_scores: np.ndarray
+    slot_members: dict[str, list[int]]  # slot name -> indices of its classes
+    cat_members: dict[str, list[int]]   # category name -> indices of its classes (keys define category_idx)
+
+
+def build_class_arrays(classes):
+    """
+    Lay out a class catalog as parallel arrays; returns a CatalogArrays.
+    Raises ValueError if a class has a time_slot that is not in TIME_SLOTS.
+    """
+    names = list(classes)
+    for c in names:
+        if classes[c]["time_slot"] not in TIME_SLOTS:
+            raise ValueError(f"Class {c!r} has time_slot {classes[c]['time_slot']!r}, expected one of {TIME_SLOTS}")
+    slot_members = {slot: [i for i, c in enumerate(names) if classes[c]["time_slot"] == slot] for slot in TIME_SLOTS}
+    cat_members = {}
+    for i, c in enumerate(names):
+        cat_members.setdefault(classes[c]["category"], []).append(i)
+    categories = list(cat_members)
+    prices = np.array([classes[c]["price"] for c in names], dtype=np.int32)
+    durations = np.array([classes[c]["duration"] for c in names], dtype=np.int32)
+    category_idx = np.array([categories.index(classes[c]["category"]) for c in names], dtype=np.int32)
+    slot_idx = np.array([TIME_SLOTS.index(classes[c]["time_slot"]) for c in names], dtype=np.int32)
+    default_scores = np.array([classes[c]["preference_score"] for c in names])
+    # The arrays are shared by every caller (get_scores returns default_scores itself), so freeze them
+    for arr in (prices, durations, category_idx, slot_idx, default_scores):
+        arr.flags.writeable = False
+    return CatalogArrays(names, prices, durations, category_idx, slot_idx, default_scores, slot_members, cat_members)
+
+
+CLASS_ARRAYS = build_class_arrays(CLASSES)
+DEFAULT_SCORE_BY_NAME = MappingProxyType(dict(zip(CLASS_ARRAYS.names, CLASS_ARRAYS.default_scores.tolist())))
+
+
+def get_class_arrays(classes):
+    """
+    CatalogArrays for classes; precomputed for CLASSES, built on the fly for any other catalog
+    (once per recommendation: callers pass the result down instead of rebuilding it).
+    """
+    if classes is CLASSES:
+        return CLASS_ARRAYS
+    return build_class_arrays(classes)
 
 # ============================================
 # PERSONALIZATION: User-specific preference scores
@@ -65,9 +142,12 @@ ACTIVE_USER = "mixed"
 # prefers plans that span more categories (variety) when satisfaction is similar.
 # Set DIVERSITY_BONUS = 0 to turn off diversity (only maximize satisfaction).
 
-CATEGORIES = ["cardio", "mind_body", "strength"]  # Must match CLASSES[c]["category"]
+CATEGORIES = tuple(CLASS_ARRAYS.cat_members)  # Categories of CLASSES, in catalog order (as category_idx)
 DIVERSITY_BONUS = 2.0   # Added to objective per category in the plan (e.g. 2 categories -> +4)
 
+# Categories used by a plan are tracked as a bitmask (bit i = CATEGORIES[i]) instead of a set:
+# category_mask ORs the class bits together, then mask.bit_count() is the number of categories.
+
 # ============================================
 # TOP-2 PLANS: Best and second-best alternatives
 # ============================================
@@ -77,9 +157,22 @@ DIVERSITY_BONUS = 2.0   # Added to objective per category in the plan (e.g. 2 ca
 #      the first plan, then solve again to get the best alternative (second-best plan).
 # The exclusion constraint: sum(1 - x[c] for c in plan1) + sum(x[c] for c not in plan1) >= 1
 #   forces at least one difference (either drop a class from plan1 or add a class not in plan1).
+#   It is written as a single no-good cut with sign-flipped coefficients and the constant on the
+#   right-hand side: sum((-1 if c in plan1 else 1) * x[c]) >= 1 - |plan1|.
 # So the second solution is a different set of classes with the next-best objective value.
 TOP2_ENABLED = True   # Set False to only compute plan 1
 
+# ============================================
+# SOLVER BACKEND
+# ============================================
+# With only a handful of classes there are at most 2**N candidate plans, so checking every
+# plan with NumPy is far cheaper than starting an ILP solver. "enumerate" uses that for
+# catalogs up to ENUMERATE_MAX_CLASSES classes and solves larger ones with "highs"
+# (scipy.optimize.milp: HiGHS called in-process, no subprocess or model file). "pulp" opts
+# into the original PuLP + CBC path.
+SOLVER_BACKEND = "enumerate"
+ENUMERATE_MAX_CLASSES = 16
+
 
 def get_preferences_for_user(user_id_or_preferences):
     """
@@ -102,141 +195,635 @@ def get_score(class_name, user_preferences):
     return CLASSES[class_name]["preference_score"]
 
 
+def get_scores(arrays, user_preferences):
+    """Per-class preference scores for a CatalogArrays, as an array in catalog order (one pass per user)."""
+    if not user_preferences:
+        return arrays.default_scores
+    # User overrides merged over the defaults in one step, instead of a membership test per class
+    if arrays is CLASS_ARRAYS:
+        defaults = DEFAULT_SCORE_BY_NAME
+    else:
+        defaults = dict(zip(arrays.names, arrays.default_scores.tolist()))
+    by_name = {**defaults, **user_preferences}
+    return np.array([by_name[c] for c in arrays.names])
+
+
 def get_categories(classes):
-    """Unique categories in class catalog."""
-    return list({classes[c]["category"] for c in classes})
+    """Unique categories in class catalog, in catalog order (precomputed for CLASSES, see CATEGORIES)."""
+    return list(get_class_arrays(classes).cat_members)
+
+
+def category_mask(cat_ids):
+    """Category bitmask (bit i = category i) of the selected classes' category indices."""
+    mask = 0
+    for i in cat_ids.tolist():
+        mask |= 1 << i
+    return mask
+
+
+def category_count(cat_idx):
+    """Number of categories spanned by a category_idx array (0 for an empty catalog)."""
+    return int(cat_idx.max()) + 1 if len(cat_idx) else 0
+
+
+def categories_from_mask(mask, categories):
+    """Category names for the set bits of a category bitmask (bit i = categories[i])."""
+    return [cat for i, cat in enumerate(categories) if mask >> i & 1]
 
 
 def get_classes_by_category(classes):
     """Return dict category -> list of class names (for diversity: which classes count toward each category)."""
-    by_cat = {}
-    for c in classes:
-        cat = classes[c]["category"]
-        by_cat.setdefault(cat, []).append(c)
-    return by_cat
+    arrays = get_class_arrays(classes)
+    return {cat: [arrays.names[i] for i in members] for cat, members in arrays.cat_members.items()}
 
 
-def build_problem(classes, user_preferences, max_budget, max_classes, max_duration, diversity_bonus, exclude_set=None):
+def build_problem(arrays, scores, max_budget, max_classes, max_duration, diversity_bonus, exclude_set=None):
     """
     Build ILP: maximize (satisfaction + diversity), subject to budget, count, duration, one per slot.
+    arrays is the catalog from get_class_arrays, scores the per-class preference score array
+    from get_scores (catalog order).
     If exclude_set is given, add constraint so we cannot select exactly that set (for 2nd plan).
     Returns (problem, x, y_cat).
     """
+    names, slot_members, cat_members = arrays.names, arrays.slot_members, arrays.cat_members
     problem = LpProblem("Gym_Recommendation", LpMaximize)
-    x = {c: LpVariable(f"x_{c}", cat="Binary") for c in classes}
-    categories = get_categories(classes)
-    # y[cat] = 1 if at least one class in category cat is selected
-    y = {cat: LpVariable(f"y_{cat}", cat="Binary") for cat in categories}
+    x = {c: LpVariable(f"x_{c}", cat="Binary") for c in names}
+    xs = [x[c] for c in names]
+    # y[cat] = 1 if at least one class in category cat is selected. Only y <= sum(x in cat)
+    # is needed: we maximize with a positive bonus, so y reaches min(1, sum(x)) at the optimum,
+    # which is integral whenever x is, and y can stay continuous in [0, 1].
+    y = {cat: LpVariable(f"y_{cat}", lowBound=0, upBound=1, cat="Continuous") for cat in cat_members}
 
     # Objective: satisfaction + diversity
-    satisfaction = lpSum(get_score(c, user_preferences) * x[c] for c in classes)
-    diversity = lpSum(diversity_bonus * y[cat] for cat in categories)
+    # LpAffineExpression is built directly from (variable, coefficient) pairs so no
+    # intermediate expressions are created per term (as lpSum(coef * x) would do).
+    satisfaction = LpAffineExpression(zip(xs, scores.tolist()))
+    diversity = LpAffineExpression((y[cat], diversity_bonus) for cat in cat_members)
     problem += satisfaction + diversity, "Objective"
 
     # Constraints
-    problem += lpSum(classes[c]["price"] * x[c] for c in classes) <= max_budget, "Budget"
-    problem += lpSum(x[c] for c in classes) <= max_classes, "Max_Classes"
-    problem += lpSum(classes[c]["duration"] * x[c] for c in classes) <= max_duration, "Max_Duration"
+    problem += LpAffineExpression(zip(xs, arrays.prices.tolist())) <= max_budget, "Budget"
+    problem += LpAffineExpression((xc, 1) for xc in xs) <= max_classes, "Max_Classes"
+    problem += LpAffineExpression(zip(xs, arrays.durations.tolist())) <= max_duration, "Max_Duration"
 
     for slot in TIME_SLOTS:
-        in_slot = [c for c in classes if classes[c]["time_slot"] == slot]
-        problem += lpSum(x[c] for c in in_slot) <= 1, f"Slot_{slot}"
+        problem += LpAffineExpression((xs[i], 1) for i in slot_members[slot]) <= 1, f"Slot_{slot}"
 
-    # Link y_cat to x: y_cat >= 0 and if any x[c]=1 in cat then y_cat can be 1
-    for cat in categories:
-        in_cat = [c for c in classes if classes[c]["category"] == cat]
-        problem += lpSum(x[c] for c in in_cat) >= y[cat], f"Cat_has_class_{cat}"
-        problem += lpSum(x[c] for c in in_cat) <= len(in_cat) * y[cat], f"Cat_upper_{cat}"
+    # Link y_cat to x: y_cat can only be 1 if some x[c]=1 in cat
+    for cat, in_cat in cat_members.items():
+        problem += LpAffineExpression([(xs[i], 1) for i in in_cat] + [(y[cat], -1)]) >= 0, f"Cat_has_class_{cat}"
 
     # Exclude previous solution (for top-2 plans)
     if exclude_set:
-        # "Not this set": at least one difference from exclude_set.
-        # Sum(1-x[c] for c in set) + Sum(x[c] for c not in set) >= 1
-        # so we either drop something in the set or pick something outside it.
-        problem += lpSum(1 - x[c] for c in exclude_set) + lpSum(x[c] for c in classes if c not in exclude_set) >= 1, "Exclude_prev"
+        problem += build_exclude_cut(x, frozenset(exclude_set)), "Exclude_prev"
 
     return problem, x, y
 
 
-def get_solution(classes, x, user_preferences=None):
-    """Return (recommended_list, total_price, total_duration, total_score, categories_used)."""
-    recommended = [c for c in classes if x[c].value() == 1]
-    total_price = sum(classes[c]["price"] for c in recommended)
-    total_duration = sum(classes[c]["duration"] for c in recommended)
-    total_score = sum(get_score(c, user_preferences) for c in recommended)
-    categories_used = list({classes[c]["category"] for c in recommended})
-    return recommended, total_price, total_duration, total_score, categories_used
+def build_exclude_cut(x, exclude_set):
+    """
+    "Not this set" no-good cut: at least one difference from exclude_set (a frozenset of names).
+    Sum(1-x[c] for c in set) + Sum(x[c] for c not in set) >= 1, with the constant moved to the
+    right-hand side: Sum(-x[c] for c in set) + Sum(x[c] for c not in set) >= 1 - |set|.
+    """
+    return LpAffineExpression((xc, -1 if c in exclude_set else 1) for c, xc in x.items()) >= 1 - len(exclude_set)
+
+
+@dataclass(slots=True, frozen=True)
+class PlanResult:
+    """One recommended plan: selected classes (catalog order) and their totals."""
+    classes: tuple[str, ...]
+    price: int
+    duration: int
+    score: int | float  # float when the user's preference scores are floats
+    categories: tuple[str, ...]
+
+
+def get_solution(arrays, x, scores):
+    """Return the PlanResult for the selected x values of a solved PuLP model."""
+    names = arrays.names
+    # Read every variable value once into a selection mask (binaries can come back as 0.9999...)
+    sel = np.fromiter((x[c].value() for c in names), dtype=np.float64, count=len(names)) > 0.5
+    return summarize_selection(arrays, sel, scores)
+
+
+def summarize_selection(arrays, sel, scores):
+    """PlanResult for a boolean selection mask in catalog order (see get_solution)."""
+    mask = category_mask(arrays.category_idx[sel])
+    return PlanResult(
+        classes=tuple(arrays.names[i] for i in np.flatnonzero(sel)),
+        price=int(arrays.prices[sel].sum()),
+        duration=int(arrays.durations[sel].sum()),
+        score=scores[sel].sum().item(),
+        categories=tuple(categories_from_mask(mask, list(arrays.cat_members))),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_slot_choice_plans(slot_ids):
+    """
+    Candidate plans for enumerate_solve, built once per slot layout (tuple of slot index per class).
+    Returns (bits, masks): bits[p, i] = 1 if plan p selects class i, masks[p] its class bitmask.
+    """
+    n = len(slot_ids)
+    slot_idx = np.array(slot_ids)
+    slot_members = [np.flatnonzero(slot_idx == s) for s in range(len(TIME_SLOTS))]
+    # choices[p, s] = 0 for no class in slot s, k for the k-th class of the slot
+    choices = np.stack(
+        np.meshgrid(*[np.arange(len(members) + 1) for members in slot_members], indexing="ij"), axis=-1
+    ).reshape(-1, len(slot_members))
+    bits = np.zeros((len(choices), n), dtype=np.int8)
+    for s, members in enumerate(slot_members):
+        rows = np.flatnonzero(choices[:, s])
+        bits[rows, members[choices[rows, s] - 1]] = 1
+    masks = bits @ (1 << np.arange(n))
+    bits.flags.writeable = False
+    masks.flags.writeable = False
+    return bits, masks
+
+
+def enumerate_solve(scores, prices, durations, slot_idx, cat_idx, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    Solve the recommendation model by checking every candidate plan at once.
+    "One class per slot" is built into the candidates instead of checked: each slot takes
+    either no class or one of its classes, so the plans are the product of per-slot choices
+    (3 * 3 * 3 = 27 for CLASSES instead of 2**6 = 64 subsets) and all satisfy the slot rule.
+    Returns (sel1, obj1, sel2, obj2): boolean selection masks (catalog order) and objective
+    values of the best and second-best feasible plans; entries are None if missing.
+    Ties keep the plan with the lower class bitmask, as in recommend_batch.
+    """
+    bits, masks = get_slot_choice_plans(tuple(slot_idx.tolist()))   # [plans, N]
+    cat_onehot = np.eye(category_count(cat_idx), dtype=np.int8)[cat_idx]  # [N, cats]
+
+    feasible = (
+        (bits @ prices <= max_budget)
+        & (bits.sum(1) <= max_classes)
+        & (bits @ durations <= max_duration)
+    )
+    objective = bits @ scores + diversity_bonus * ((bits @ cat_onehot) > 0).sum(1)
+
+    candidates = np.flatnonzero(feasible)
+    if len(candidates) == 0:
+        return None, None, None, None
+    if len(candidates) == 1:
+        best = candidates[0]
+        return bits[best].astype(bool), objective[best].item(), None, None
+    # Two best objectives, then every candidate tied with them, ordered by (objective, bitmask)
+    top_two = np.partition(-objective[candidates], 1)[:2]
+    tied = candidates[-objective[candidates] <= top_two[1]]
+    best, second = sorted(tied, key=lambda p: (-objective[p], masks[p]))[:2]
+    return bits[best].astype(bool), objective[best].item(), bits[second].astype(bool), objective[second].item()
+
+
+def build_specialized_solver(classes, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    Generate a top-2 solver specialized to one catalog and set of limits.
+
+    Which plans are feasible does not depend on the user, so the generated source only lists
+    the feasible plans (from get_slot_choice_plans), each as one straight-line objective: the
+    selected score terms plus that plan's constant diversity bonus. There are no loops, dicts or
+    feasibility checks left at call time. Plans are listed by increasing bitmask and only a
+    strictly better objective replaces the incumbent, so ties resolve as in enumerate_solve.
+
+    Returns a function scores -> (mask1, obj1, mask2, obj2) taking the user's scores as a
+    sequence in catalog order; masks are class bitmasks, -1 if there is no such plan.
+    """
+    arrays = get_class_arrays(classes)
+    prices, durations, category_idx = arrays.prices, arrays.durations, arrays.category_idx
+    bits, masks = get_slot_choice_plans(tuple(arrays.slot_idx.tolist()))
+    feasible = (bits @ prices <= max_budget) & (bits.sum(1) <= max_classes) & (bits @ durations <= max_duration)
+
+    lines = [
+        "def solve_specialized(scores):",
+        f"    {''.join(f's{i}, ' for i in range(len(prices)))}= scores",
+        "    best = second = float('-inf')",
+        "    best_m = second_m = -1",
+    ]
+    for p in sorted(np.flatnonzero(feasible), key=lambda p: masks[p]):
+        picked = np.flatnonzero(bits[p])
+        bonus = float(diversity_bonus * category_mask(category_idx[picked]).bit_count())
+        m = int(masks[p])
+        lines += [
+            f"    o = {' + '.join([f's{i}' for i in picked] + [repr(bonus)])}",
+            "    if o > best:",
+            f"        second, second_m, best, best_m = best, best_m, o, {m}",
+            "    elif o > second:",
+            f"        second, second_m = o, {m}",
+        ]
+    lines.append("    return best_m, best, second_m, second")
+
+    namespace = {}
+    exec(compile("\n".join(lines), "<specialized>", "exec"), namespace)
+    return namespace["solve_specialized"]
+
+
+# Solver generated at import for CLASSES and the default limits (see get_top2_plans_enumerate)
+SPECIALIZED_LIMITS = (MAX_BUDGET, MAX_CLASSES, MAX_DURATION, DIVERSITY_BONUS)
+solve_specialized = build_specialized_solver(CLASSES, *SPECIALIZED_LIMITS)
+
+
+def mask_to_selection(mask, n):
+    """Boolean selection mask (catalog order) for a class bitmask over n classes."""
+    return (mask & (1 << np.arange(n))) > 0
+
+
+def tighten_max_classes(prices, durations, slot_idx, max_budget, max_classes, max_duration):
+    """
+    Tightest class count implied by the other limits: no plan can hold more classes than
+    there are slots, or than the k cheapest (k shortest) classes that fit the budget (duration).
+    """
+    k_price = np.searchsorted(np.cumsum(np.sort(prices)), max_budget, side="right")
+    k_duration = np.searchsorted(np.cumsum(np.sort(durations)), max_duration, side="right")
+    return int(min(max_classes, k_price, k_duration, len(np.unique(slot_idx))))
+
+
+def presolve_dominations(scores, prices, durations, slot_idx, cat_idx, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    Presolve for the best plan: fix dominated classes to 0 and tighten the class count.
+
+    At most one class per slot is picked, so if class a in the same slot as b scores at least
+    as high for this user (by the diversity bonus more if the categories differ, since the swap
+    may lose b's category), costs no more and is no longer, any plan with b can swap b for a
+    without getting worse and x[b] can be fixed to 0 (exact ties keep the first class). This
+    only holds for the best plan (plan 2 may be exactly plan 1 with such a swap), so callers
+    apply x_upper to the first solve only; the count limit from tighten_max_classes holds for
+    every plan.
+
+    Returns (x_upper, max_classes): per-class upper bounds (0 = fixed out) and the count limit.
+    check_ilp_backends.py compares every backend with brute force; run it after changing this.
+    """
+    n = len(prices)
+    margin = np.where(cat_idx[:, None] == cat_idx[None, :], 0, diversity_bonus)
+    weak = (
+        (scores[:, None] >= scores[None, :] + margin)
+        & (prices[:, None] <= prices[None, :])
+        & (durations[:, None] <= durations[None, :])
+    )
+    strict = (
+        (scores[:, None] > scores[None, :] + margin)
+        | (prices[:, None] < prices[None, :])
+        | (durations[:, None] < durations[None, :])
+    )
+    first = np.arange(n)[:, None] < np.arange(n)[None, :]
+    dominates = (slot_idx[:, None] == slot_idx[None, :]) & weak & (strict | first)   # dominates[a, b]
+    x_upper = (~dominates.any(0)).astype(np.float64)
+    return x_upper, tighten_max_classes(prices, durations, slot_idx, max_budget, max_classes, max_duration)
+
+
+def build_highs_rows(prices, durations, slot_idx, cat_idx, max_budget, max_classes, max_duration):
+    """
+    Constraint rows of the recommendation ILP for HiGHS (no objective).
+    Columns are x (one binary per class) followed by y (one per category, continuous in
+    [0, 1] with only the y <= sum(x in cat) link, as in build_problem).
+    Returns (A, lower, upper) with one row per constraint.
+    """
+    n = len(prices)
+    n_cats = category_count(cat_idx)
+    slot_onehot = np.eye(len(TIME_SLOTS))[slot_idx].T                           # [slots, N]
+    cat_onehot = np.eye(n_cats)[cat_idx].T                                       # [cats, N]
+
+    rows = [
+        np.concatenate([prices, np.zeros(n_cats)]),
+        np.concatenate([np.ones(n), np.zeros(n_cats)]),
+        np.concatenate([durations, np.zeros(n_cats)]),
+    ]
+    rows.extend(np.concatenate([slot_row, np.zeros(n_cats)]) for slot_row in slot_onehot)
+    rows.extend(np.hstack([-cat_onehot, np.eye(n_cats)]))
+    lower = np.full(len(rows), -np.inf)
+    upper = np.array([max_budget, max_classes, max_duration] + [1] * len(slot_onehot) + [0] * n_cats, dtype=np.float64)
+    return np.array(rows), lower, upper
+
+
+def no_good_cut(exclude, n_cats):
+    """
+    Row that forbids exactly the plan in selection mask exclude:
+    Sum(-x[c] for c in set) + Sum(x[c] for c not in set) >= 1 - |set|.
+    Returns (row, lower bound).
+    """
+    return np.concatenate([np.where(exclude, -1.0, 1.0), np.zeros(n_cats)]), 1 - exclude.sum()
+
+
+def solve_with_highs(scores, prices, durations, slot_idx, cat_idx, max_budget, max_classes, max_duration, diversity_bonus, exclude=None, x_upper=None):
+    """
+    Solve the recommendation ILP with HiGHS through scipy.optimize.milp (see build_highs_rows).
+    exclude is an optional boolean selection mask that the plan must differ from (no-good cut).
+    x_upper optionally gives per-class upper bounds (0 fixes a class out, see presolve_dominations).
+    Returns (sel, obj): boolean selection mask (catalog order) and objective, or (None, None).
+    """
+    n = len(prices)
+    n_cats = category_count(cat_idx)
+    if n == 0:  # milp needs at least one column; the empty plan is then the only plan
+        return (np.zeros(0, dtype=bool), 0.0) if exclude is None else (None, None)
+    A, lower, upper = build_highs_rows(prices, durations, slot_idx, cat_idx, max_budget, max_classes, max_duration)
+    if exclude is not None:
+        cut, cut_lower = no_good_cut(exclude, n_cats)
+        A = np.vstack([A, cut])
+        lower = np.append(lower, cut_lower)
+        upper = np.append(upper, np.inf)
+
+    result = milp(
+        c=-np.concatenate([scores, np.full(n_cats, diversity_bonus)]),  # milp minimizes
+        constraints=LinearConstraint(A, lower, upper),
+        integrality=np.concatenate([np.ones(n), np.zeros(n_cats)]),
+        bounds=Bounds(0, np.concatenate([np.ones(n) if x_upper is None else x_upper, np.ones(n_cats)])),
+    )
+    if result.status != 0:
+        return None, None
+    sel = result.x[:n] > 0.5
+    # Objective recomputed from the selection so it is exact (no solver tolerance).
+    obj = scores[sel].sum().item() + diversity_bonus * category_mask(cat_idx[sel]).bit_count()
+    return sel, obj
 
 
-def print_plan(plan_label, recommended, total_price, total_duration, total_score, categories_used, user_preferences=None):
-    """Print one plan summary."""
-    print(f"\n--- {plan_label} ---")
-    if not recommended:
-        print("  (No feasible plan)")
-        return
-    for c in recommended:
+@njit(parallel=True, cache=True)
+def recommend_batch(scores_un, prices_n, durations_n, slot_ids_n, cat_ids_n, max_b, max_c, max_d, div_bonus, n_slots, n_cats):
+    """
+    Enumeration kernel for many users at once (users run in parallel under numba).
+    scores_un is a (users, classes) score matrix; the other arrays are int32 catalog arrays.
+    Returns (best_mask_u, second_mask_u, obj1_u, obj2_u): plans as class bitmasks (-1 if none).
+    Ties keep the lower bitmask, as in enumerate_solve.
+    """
+    n_users, n = scores_un.shape
+    best_mask = np.full(n_users, -1, np.int64)
+    second_mask = np.full(n_users, -1, np.int64)
+    obj1 = np.full(n_users, -np.inf)
+    obj2 = np.full(n_users, -np.inf)
+    for u in prange(n_users):
+        slot_count = np.zeros(n_slots, np.int32)
+        cat_seen = np.zeros(n_cats, np.int32)
+        for m in range(1 << n):
+            slot_count[:] = 0
+            cat_seen[:] = 0
+            price = 0
+            duration = 0
+            count = 0
+            score = 0.0
+            feasible = True
+            for i in range(n):
+                if (m >> i) & 1:
+                    slot_count[slot_ids_n[i]] += 1
+                    if slot_count[slot_ids_n[i]] > 1:
+                        feasible = False
+                        break
+                    cat_seen[cat_ids_n[i]] = 1
+                    price += prices_n[i]
+                    duration += durations_n[i]
+                    count += 1
+                    score += scores_un[u, i]
+            if not feasible or price > max_b or count > max_c or duration > max_d:
+                continue
+            objective = score + div_bonus * cat_seen.sum()
+            if objective > obj1[u]:
+                second_mask[u] = best_mask[u]
+                obj2[u] = obj1[u]
+                best_mask[u] = m
+                obj1[u] = objective
+            elif objective > obj2[u]:
+                second_mask[u] = m
+                obj2[u] = objective
+    return best_mask, second_mask, obj1, obj2
+
+
+def format_plan(plan_label, plan, user_preferences=None):
+    """Format one PlanResult summary (several lines, no trailing newline); plan may be None."""
+    lines = ["", f"--- {plan_label} ---"]
+    if plan is None or not plan.classes:
+        lines.append("  (No feasible plan)")
+        return "\n".join(lines)
+    for c in plan.classes:
         info = CLASSES[c]
         sc = get_score(c, user_preferences)
-        print(f"  - {c}: {info['time_slot']}, {info['duration']}min, ${info['price']}, score={sc}, category={info['category']}")
-    print(f"  Total: ${total_price}, {total_duration} min, satisfaction={total_score}, categories={categories_used}")
+        lines.append(f"  - {c}: {info['time_slot']}, {info['duration']}min, ${info['price']}, score={sc}, category={info['category']}")
+    categories_used = list(plan.categories)
+    lines.append(f"  Total: ${plan.price}, {plan.duration} min, satisfaction={plan.score}, categories={categories_used}")
     if categories_used and DIVERSITY_BONUS:
-        print(f"  Diversity: {len(categories_used)} categories -> bonus +{len(categories_used) * DIVERSITY_BONUS}")
+        lines.append(f"  Diversity: {len(categories_used)} categories -> bonus +{len(categories_used) * DIVERSITY_BONUS}")
+    return "\n".join(lines)
+
 
+_TEMPLATE = None  # (limits, problem, x, y) for CLASSES, cached by get_problem_template
 
-def get_top2_plans(classes, user_preferences, max_budget, max_classes, max_duration, diversity_bonus):
+
+@lru_cache(maxsize=None)
+def get_cbc_solver(warm_start=False):
     """
-    Top-2 plans: solve ILP twice to get best and second-best recommendation sets.
+    Shared CBC solver for the PuLP backend, created on first use so CBC is only needed when
+    that backend runs. CBC presolve is off: on a model this small it costs more than it saves.
+    """
+    return PULP_CBC_CMD(msg=False, threads=1, presolve=False, warmStart=warm_start)
+
 
-    Step 1: Solve with exclude_set=None -> best plan.
-    Step 2: Solve with exclude_set=set(plan1_classes) -> best plan that is not plan1 (second-best).
+def get_problem_template(arrays, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    PuLP model reused across users, with the user's objective set by the caller: built once per
+    set of limits for CLASSES (which is read-only) and on every call for any other catalog, since
+    the caller may edit that dict in place. Returns (problem, x, y_cat) like build_problem.
+    """
+    global _TEMPLATE
+    if arrays is not CLASS_ARRAYS:
+        return build_problem(arrays, arrays.default_scores, max_budget, max_classes, max_duration, diversity_bonus)
+    limits = (max_budget, max_classes, max_duration, diversity_bonus)
+    if _TEMPLATE is None or _TEMPLATE[0] != limits:
+        problem, x, y = build_problem(arrays, arrays.default_scores, max_budget, max_classes, max_duration, diversity_bonus)
+        _TEMPLATE = (limits, problem, x, y)
+    return _TEMPLATE[1:]
+
+
+def get_top2_plans(classes, user_preferences, max_budget, max_classes, max_duration, diversity_bonus, backend=None):
+    """
+    Top-2 plans: best and second-best recommendation sets.
+
+    Dispatches on backend (default SOLVER_BACKEND): "enumerate" checks every plan for
+    small catalogs (see enumerate_solve), "highs" solves the ILP in-process with HiGHS
+    (also used for catalogs too large to enumerate) and "pulp" solves it with PuLP + CBC.
 
     Returns:
-        (rec1, price1, dur1, score1, obj1, rec2, price2, dur2, score2, obj2)
-        where rec2/price2/... can be None if no second feasible plan.
+        (plan1, obj1, plan2, obj2): PlanResult and objective (satisfaction + diversity) of each
+        plan; plan2/obj2 are None if there is no second feasible plan, all four if none at all.
+    """
+    backend = backend or SOLVER_BACKEND
+    arrays = get_class_arrays(classes)  # built once here and passed down to the backend
+    if backend == "pulp":
+        return get_top2_plans_pulp(arrays, user_preferences, max_budget, max_classes, max_duration, diversity_bonus)
+    if backend == "enumerate" and len(arrays.names) <= ENUMERATE_MAX_CLASSES:
+        return get_top2_plans_enumerate(arrays, user_preferences, max_budget, max_classes, max_duration, diversity_bonus)
+    return get_top2_plans_highs(arrays, user_preferences, max_budget, max_classes, max_duration, diversity_bonus)
+
+
+def get_top2_plans_enumerate(arrays, user_preferences, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    Top-2 plans by exhaustive enumeration of a CatalogArrays; same return value as get_top2_plans.
+    Uses the generated solve_specialized for CLASSES with the default limits, enumerate_solve otherwise.
     """
-    problem1, x1, _ = build_problem(
-        classes, user_preferences, max_budget, max_classes, max_duration, diversity_bonus, exclude_set=None
+    scores = get_scores(arrays, user_preferences)
+    n = len(arrays.names)
+    if arrays is CLASS_ARRAYS and (max_budget, max_classes, max_duration, diversity_bonus) == SPECIALIZED_LIMITS:
+        m1, obj1, m2, obj2 = solve_specialized(scores.tolist())
+        sel1 = mask_to_selection(m1, n) if m1 >= 0 else None
+        sel2 = mask_to_selection(m2, n) if m2 >= 0 else None
+    else:
+        sel1, obj1, sel2, obj2 = enumerate_solve(
+            scores, arrays.prices, arrays.durations, arrays.slot_idx, arrays.category_idx,
+            max_budget, max_classes, max_duration, diversity_bonus,
+        )
+    if sel1 is None:
+        return None, None, None, None
+
+    plan1 = summarize_selection(arrays, sel1, scores)
+    if not TOP2_ENABLED or sel2 is None:
+        return plan1, obj1, None, None
+
+    plan2 = summarize_selection(arrays, sel2, scores)
+    return plan1, obj1, plan2, obj2
+
+
+def get_top2_plans_highs(arrays, user_preferences, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    Top-2 plans with HiGHS: solve with the presolve fixings (presolve_dominations), then
+    re-solve without them plus a no-good cut on plan 1; same return value as get_top2_plans.
+    """
+    scores = get_scores(arrays, user_preferences)
+    catalog = (arrays.prices, arrays.durations, arrays.slot_idx, arrays.category_idx)
+    x_upper, max_classes = presolve_dominations(
+        scores, *catalog, max_budget, max_classes, max_duration, diversity_bonus
     )
-    problem1.solve()
+    args = (scores, *catalog, max_budget, max_classes, max_duration, diversity_bonus)
+    sel1, obj1 = solve_with_highs(*args, x_upper=x_upper)
+    if sel1 is None:
+        return None, None, None, None
+
+    plan1 = summarize_selection(arrays, sel1, scores)
+    if not TOP2_ENABLED:
+        return plan1, obj1, None, None
+
+    sel2, obj2 = solve_with_highs(*args, exclude=sel1)
+    if sel2 is None:
+        return plan1, obj1, None, None
+
+    plan2 = summarize_selection(arrays, sel2, scores)
+    return plan1, obj1, plan2, obj2
+
+
+def get_top2_plans_pulp(arrays, user_preferences, max_budget, max_classes, max_duration, diversity_bonus):
+    """
+    Top-2 plans: solve ILP twice to get best and second-best recommendation sets.
+
+    Step 1: Solve the cached model (see get_problem_template) with this user's objective and
+            the presolve fixings from presolve_dominations -> best plan.
+    Step 2: Add the exclude_set=frozenset(plan1_classes) cut to the same problem and re-solve,
+            warm-started from plan 1 -> best plan that is not plan1 (second-best).
+
+    Same return value as get_top2_plans.
+    """
+    scores = get_scores(arrays, user_preferences)
+    x_upper, max_classes = presolve_dominations(
+        scores, arrays.prices, arrays.durations, arrays.slot_idx, arrays.category_idx,
+        max_budget, max_classes, max_duration, diversity_bonus,
+    )
+    # Only the objective depends on the user: reuse the cached model and swap the objective in.
+    problem1, x1, y1 = get_problem_template(arrays, max_budget, max_classes, max_duration, diversity_bonus)
+    problem1.constraints.pop("Exclude_prev", None)
+    for xc, ub in zip(x1.values(), x_upper.tolist()):
+        xc.upBound = ub
+    problem1.setObjective(
+        LpAffineExpression(zip(x1.values(), scores.tolist()))
+        + LpAffineExpression((y1[cat], diversity_bonus) for cat in y1)
+    )
+    problem1.solve(get_cbc_solver())
     if problem1.status != 1:
-        return None, None, None, None, None, None, None, None, None, None
+        return None, None, None, None
 
-    rec1, price1, dur1, score1, cat1 = get_solution(classes, x1, user_preferences)
+    plan1 = get_solution(arrays, x1, scores)
     obj1 = problem1.objective.value()
 
     if not TOP2_ENABLED:
-        return rec1, price1, dur1, score1, obj1, None, None, None, None, None
-
-    problem2, x2, _ = build_problem(
-        classes, user_preferences, max_budget, max_classes, max_duration, diversity_bonus, exclude_set=set(rec1)
-    )
-    problem2.solve()
-    if problem2.status != 1:
-        return rec1, price1, dur1, score1, obj1, None, None, None, None, None
+        return plan1, obj1, None, None
+
+    # Plan 2 differs from plan 1 only by the "not this set" cut, so reuse problem1:
+    # seed CBC with plan 1 as the incumbent, add the cut and re-solve in place.
+    # The dominance fixings only hold for the best plan, so release them first.
+    plan1_set = frozenset(plan1.classes)
+    for c in arrays.names:
+        x1[c].upBound = 1
+        x1[c].setInitialValue(1 if c in plan1_set else 0)
+    problem1 += build_exclude_cut(x1, plan1_set), "Exclude_prev"
+    problem1.solve(get_cbc_solver(warm_start=True))
+    if problem1.status != 1:
+        return plan1, obj1, None, None
 
-    rec2, price2, dur2, score2, cat2 = get_solution(classes, x2, user_preferences)
-    obj2 = problem2.objective.value()
-    return rec1, price1, dur1, score1, obj1, rec2, price2, dur2, score2, obj2
+    plan2 = get_solution(arrays, x1, scores)
+    obj2 = problem1.objective.value()
+    return plan1, obj1, plan2, obj2
 
 
-def recommend_for_user(user_id_or_preferences, max_budget=MAX_BUDGET, max_classes=MAX_CLASSES, max_duration=MAX_DURATION):
+def recommend_for_user(user_id_or_preferences, max_budget=MAX_BUDGET, max_classes=MAX_CLASSES, max_duration=MAX_DURATION, verbose=False):
     """
     Run personalized recommendation for one user. Returns top-2 plans (best and second-best).
 
     Args:
         user_id_or_preferences: profile name (str) from USER_PROFILES, or dict of class_name -> score, or None for default.
         max_budget, max_classes, max_duration: optional constraint overrides.
+        verbose: also write both plan summaries to stdout (off for library / batched use).
 
     Returns:
-        (plan1_list, plan1_score, plan2_list, plan2_score) or (plan1, s1, None, None) if no second plan.
+        (plan1, plan2) as PlanResult, plan2 None if there is no second plan; (None, None) if no plan.
     """
     classes = CLASSES
     user_preferences = get_preferences_for_user(user_id_or_preferences)
-    result = get_top2_plans(classes, user_preferences, max_budget, max_classes, max_duration, DIVERSITY_BONUS)
-    rec1, price1, dur1, score1, obj1, rec2, price2, dur2, score2, obj2 = result
-    if rec1 is None:
-        return None, None, None, None
-    return rec1, score1, rec2, score2
+    plan1, _, plan2, _ = get_top2_plans(classes, user_preferences, max_budget, max_classes, max_duration, DIVERSITY_BONUS)
+    if verbose:
+        plans = [format_plan("PLAN 1 (Best)", plan1, user_preferences)]
+        if plan2 is not None:
+            plans.append(format_plan("PLAN 2 (Second best)", plan2, user_preferences))
+        sys.stdout.write("\n".join(plans) + "\n")
+    return plan1, plan2
+
+
+def recommend_many(users, max_budget=MAX_BUDGET, max_classes=MAX_CLASSES, max_duration=MAX_DURATION):
+    """
+    Batched recommend_for_user: one enumeration kernel call (recommend_batch) for all users.
+
+    Args:
+        users: list of profile names from USER_PROFILES (or preference dicts / None, as in recommend_for_user).
+
+    Returns:
+        List aligned with users of (plan1, plan2) PlanResult pairs, as recommend_for_user.
+    """
+    arrays = CLASS_ARRAYS
+    n = len(arrays.names)
+    scores_un = np.array(
+        [get_scores(arrays, get_preferences_for_user(u)) for u in users]
+    ).reshape(len(users), n)
+    best_mask, second_mask, _, _ = recommend_batch(
+        scores_un, arrays.prices, arrays.durations, arrays.slot_idx, arrays.category_idx,
+        max_budget, max_classes, max_duration, DIVERSITY_BONUS, len(TIME_SLOTS), len(arrays.cat_members),
+    )
+
+    results = []
+    for scores, m1, m2 in zip(scores_un, best_mask.tolist(), second_mask.tolist()):
+        if m1 < 0:
+            results.append((None, None))
+            continue
+        plan1 = summarize_selection(arrays, mask_to_selection(m1, n), scores)
+        if not TOP2_ENABLED or m2 < 0:
+            results.append((plan1, None))
+            continue
+        results.append((plan1, summarize_selection(arrays, mask_to_selection(m2, n), scores)))
+    return results
+
+
+def recommend_all_users(profiles=USER_PROFILES, max_budget=MAX_BUDGET, max_classes=MAX_CLASSES, max_duration=MAX_DURATION):
+    """
+    Recommend for every user in profiles (user_id -> profile name, preference dict or None).
+
+    CLASSES is small enough to enumerate, so this is recommend_many over the profile values:
+    one batched kernel call for everyone, with the same plans (ties included) as recommend_for_user.
+
+    Returns:
+        dict user_id -> (plan1, plan2) PlanResult pairs, as recommend_for_user.
+    """
+    plans = recommend_many(list(profiles.values()), max_budget, max_classes, max_duration)
+    return dict(zip(profiles, plans))
 
 
 def run_recommendation():
@@ -245,36 +832,36 @@ def run_recommendation():
     user_preferences = get_preferences_for_user(ACTIVE_USER)
     user_label = ACTIVE_USER if isinstance(ACTIVE_USER, str) else ("custom" if user_preferences else "default")
 
-    print("=" * 60)
-    print("ILP RECOMMENDATION - Personalization + Diversity + Top-2 Plans")
-    print("=" * 60)
-    print(f"\nBudget: ${MAX_BUDGET}  Max classes: {MAX_CLASSES}  Max duration: {MAX_DURATION} min")
-    print(f"Diversity: +{DIVERSITY_BONUS} per category in plan (categories: {', '.join(get_categories(CLASSES))})")
-    print("User (personalization): " + user_label)
-    print("Top-2: best plan, then second-best (exclude first set)")
-
-    rec1, price1, dur1, score1, obj1, rec2, price2, dur2, score2, obj2 = get_top2_plans(
+    # Collect the whole report and write it once
+    lines = [
+        "=" * 60,
+        "ILP RECOMMENDATION - Personalization + Diversity + Top-2 Plans",
+        "=" * 60,
+        f"\nBudget: ${MAX_BUDGET}  Max classes: {MAX_CLASSES}  Max duration: {MAX_DURATION} min",
+        f"Diversity: +{DIVERSITY_BONUS} per category in plan (categories: {', '.join(get_categories(CLASSES))})",
+        "User (personalization): " + user_label,
+        "Top-2: best plan, then second-best (exclude first set)",
+    ]
+
+    plan1, obj1, plan2, obj2 = get_top2_plans(
         classes, user_preferences, MAX_BUDGET, MAX_CLASSES, MAX_DURATION, DIVERSITY_BONUS
     )
 
-    if rec1 is None:
-        print("\nNo feasible solution found.")
-        print("\n" + "=" * 60)
-        return
-
-    cat1 = list({classes[c]["category"] for c in rec1})
-    print_plan("PLAN 1 (Best)", rec1, price1, dur1, score1, cat1, user_preferences)
-    print(f"  Objective (satisfaction + diversity): {obj1}")
-
-    if rec2 is not None:
-        cat2 = list({classes[c]["category"] for c in rec2})
-        print_plan("PLAN 2 (Second best)", rec2, price2, dur2, score2, cat2, user_preferences)
-        print(f"  Objective (satisfaction + diversity): {obj2}")
+    if plan1 is None:
+        lines.append("\nNo feasible solution found.")
     else:
-        print("\n--- PLAN 2 (Second best) ---")
-        print("  No other feasible plan (only one feasible combination).")
-
-    print("\n" + "=" * 60)
+        lines.append(format_plan("PLAN 1 (Best)", plan1, user_preferences))
+        lines.append(f"  Objective (satisfaction + diversity): {obj1}")
+
+        if plan2 is not None:
+            lines.append(format_plan("PLAN 2 (Second best)", plan2, user_preferences))
+            lines.append(f"  Objective (satisfaction + diversity): {obj2}")
+        else:
+            lines.append("\n--- PLAN 2 (Second best) ---")
+            lines.append("  No other feasible plan (only one feasible combination).")
+
+    lines.append("\n" + "=" * 60)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":